@@ -8,7 +8,7 @@ from stock_utils import (
     MARKET_US,
     MARKET_HK,
     get_config,
-    get_stock_analysis,
+    analyze_symbols,
     count_rules_passed,
     format_stock_analysis_text,
     call_deepseek_api,
@@ -78,7 +78,7 @@ def generate_ai_report(stocks_data):
     stocks_analysis = []
     for (market, symbol), data in stocks_data.items():
         rules_passed = count_rules_passed(data)
-        stock_info = format_stock_analysis_text(data, symbol, market)
+        stock_info = format_stock_analysis_text(data, symbol, market, rules_passed)
         stock_info += f"综合结论: {'建议买入' if rules_passed >= MIN_RULES_PASSED else '持续观望'}\n"
         stocks_analysis.append(stock_info)
     
@@ -137,29 +137,25 @@ def main():
             print(f"[{datetime.now()}] {market_name}待分析: {', '.join(symbols)}")
     
     try:
-        # 1. 循环抓取与分析所有股票
+        # 1. 按市场批量下载并并发分析所有股票（手动触发时可选择跳过当天的行情缓存）
+        force_refresh = get_config()["FORCE_REFRESH"]
         stocks_data = {}
         failed_stocks = []
         
         for market, symbols in STOCK_CONFIG.items():
+            if not symbols:
+                continue
             market_name = get_market_name(market)
-            for symbol in symbols:
-                try:
-                    print(f"[{datetime.now()}] 正在分析{market_name} {symbol}...")
-                    data = get_stock_analysis(symbol, market)
-                    
-                    if data is None:
-                        print(f"[{datetime.now()}] ⚠️  {market_name} {symbol} 数据不足或分析失败，跳过")
-                        failed_stocks.append(f"{market_name} {symbol}")
-                        continue
-                    
-                    stocks_data[(market, symbol)] = data
-                    rules_passed = count_rules_passed(data)
-                    print(f"[{datetime.now()}] {market_name} {symbol} 分析完成，达成规则: {rules_passed}/10")
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"[{datetime.now()}] ⚠️  {market_name} {symbol} 分析失败: {error_msg}")
+            print(f"[{datetime.now()}] 正在分析{market_name} {len(symbols)} 只股票...")
+            for symbol, data in zip(symbols, analyze_symbols(symbols, market, force_refresh=force_refresh)):
+                if data is None:
+                    print(f"[{datetime.now()}] ⚠️  {market_name} {symbol} 数据不足或分析失败，跳过")
                     failed_stocks.append(f"{market_name} {symbol}")
+                    continue
+                
+                stocks_data[(market, symbol)] = data
+                rules_passed = count_rules_passed(data)
+                print(f"[{datetime.now()}] {market_name} {symbol} 分析完成，达成规则: {rules_passed}/10")
         
         if not stocks_data:
             print(f"[{datetime.now()}] ❌ 所有股票分析均失败，无法生成报告")
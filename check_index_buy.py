@@ -12,6 +12,7 @@ from stock_utils import (
     MARKET_US,
     MARKET_HK,
     detect_market,
+    get_config,
     get_stock_data,
     get_current_stock_price,
     get_display_symbol,
@@ -94,7 +95,7 @@ def analyze_volume_trend(monthly_df):
     }
 
 
-def check_index_buy_signal(symbol):
+def check_index_buy_signal(symbol, force_refresh=False):
     """
     检查单只指数型股票是否触发买入信号
     
@@ -105,6 +106,7 @@ def check_index_buy_signal(symbol):
     
     Args:
         symbol: 股票代码
+        force_refresh: 是否跳过行情缓存重新下载
     
     Returns:
         (should_buy, analysis_data): 是否建议买入和分析数据
@@ -122,7 +124,7 @@ def check_index_buy_signal(symbol):
         }
     
     # === 检查条件1：月线数据 ===
-    monthly_df = get_stock_data(symbol, market, period="2y", interval="1mo")
+    monthly_df = get_stock_data(symbol, market, period="2y", interval="1mo", force_refresh=force_refresh)
     
     if monthly_df is None or len(monthly_df) < 12:
         return None, {
@@ -135,8 +137,8 @@ def check_index_buy_signal(symbol):
     # 计算月线10MA
     monthly_df['10MA'] = monthly_df['Close'].rolling(window=10).mean()
     
-    current_10ma_monthly = monthly_df.iloc[-1]['10MA']
-    prev_10ma_monthly = monthly_df.iloc[-2]['10MA']
+    current_10ma_monthly = monthly_df['10MA'].iat[-1]
+    prev_10ma_monthly = monthly_df['10MA'].iat[-2]
     
     if pd.isna(current_10ma_monthly) or pd.isna(prev_10ma_monthly):
         return None, {
@@ -150,7 +152,7 @@ def check_index_buy_signal(symbol):
     rule_1_passed = current_10ma_monthly > prev_10ma_monthly
     
     # === 检查条件3：当前价格 < 5年线（年线MA5）===
-    yearly_df = get_stock_data(symbol, market, period="max", interval="1mo")
+    yearly_df = get_stock_data(symbol, market, period="max", interval="1mo", force_refresh=force_refresh)
     # 将月线数据重采样为年线数据
     if yearly_df is not None and len(yearly_df) > 0:
         yearly_df.index = pd.to_datetime(yearly_df.index)
@@ -168,7 +170,7 @@ def check_index_buy_signal(symbol):
         ma5_yearly_value = round(ma5_yearly, 2)
     
     # === 检查条件2：周线10MA vs 20MA ===
-    weekly_df = get_stock_data(symbol, market, period="2y", interval="1wk")
+    weekly_df = get_stock_data(symbol, market, period="2y", interval="1wk", force_refresh=force_refresh)
     
     if weekly_df is None or len(weekly_df) < 25:
         return None, {
@@ -187,8 +189,8 @@ def check_index_buy_signal(symbol):
     weekly_df['10MA'] = weekly_df['Close'].rolling(window=10).mean()
     weekly_df['20MA'] = weekly_df['Close'].rolling(window=20).mean()
     
-    ma10_weekly = weekly_df.iloc[-1]['10MA']
-    ma20_weekly = weekly_df.iloc[-1]['20MA']
+    ma10_weekly = weekly_df['10MA'].iat[-1]
+    ma20_weekly = weekly_df['20MA'].iat[-1]
     
     if pd.isna(ma10_weekly) or pd.isna(ma20_weekly):
         return None, {
@@ -234,10 +236,13 @@ def check_index_buy_signal(symbol):
     }
 
 
-def check_all_watchlist():
+def check_all_watchlist(force_refresh=False):
     """
     检查所有监控列表中的指数型股票
     
+    Args:
+        force_refresh: 是否跳过行情缓存重新下载
+    
     Returns:
         (buy_signals, all_records_data): 触发买入信号的记录和所有记录的分析数据
     """
@@ -256,7 +261,7 @@ def check_all_watchlist():
         market_name = get_market_name(market)
         
         try:
-            result, analysis_data = check_index_buy_signal(symbol)
+            result, analysis_data = check_index_buy_signal(symbol, force_refresh)
             
             if result is None:
                 error_msg = analysis_data.get('error', '未知错误')
@@ -506,8 +511,8 @@ def main():
     print(f"[{datetime.now()}] 启动指数型股票买入信号监控流水线...")
     
     try:
-        # 1. 检查所有监控列表
-        buy_signals, all_records_data = check_all_watchlist()
+        # 1. 检查所有监控列表（手动触发时可选择跳过当天的行情缓存）
+        buy_signals, all_records_data = check_all_watchlist(get_config()["FORCE_REFRESH"])
         
         if not all_records_data:
             print(f"[{datetime.now()}] ❌ 没有可检查的股票或所有检查均失败")
@@ -12,6 +12,7 @@ from stock_utils import (
     MARKET_US,
     MARKET_HK,
     detect_market,
+    get_config,
     get_stock_data,
     get_current_stock_price,
     get_display_symbol,
@@ -65,7 +66,7 @@ def calculate_holding_days(purchase_date_str):
         return None
 
 
-def check_index_sell_signal(record):
+def check_index_sell_signal(record, force_refresh=False):
     """
     检查单只指数型股票是否触发卖出信号
     
@@ -75,6 +76,7 @@ def check_index_sell_signal(record):
     
     Args:
         record: 持仓记录字典，包含 symbol, purchase_price, purchase_date, quantity(可选)
+        force_refresh: 是否跳过行情缓存重新下载
     
     Returns:
         (should_sell, analysis_data): 是否建议卖出和分析数据
@@ -105,7 +107,7 @@ def check_index_sell_signal(record):
         }
     
     # === 检查条件1：月线10MA趋势 ===
-    monthly_df = get_stock_data(symbol, market, period="2y", interval="1mo")
+    monthly_df = get_stock_data(symbol, market, period="2y", interval="1mo", force_refresh=force_refresh)
     
     if monthly_df is None or len(monthly_df) < 12:
         return None, {
@@ -122,8 +124,8 @@ def check_index_sell_signal(record):
     # 计算月线10MA
     monthly_df['10MA'] = monthly_df['Close'].rolling(window=10).mean()
     
-    current_10ma_monthly = monthly_df.iloc[-1]['10MA']
-    prev_10ma_monthly = monthly_df.iloc[-2]['10MA']
+    current_10ma_monthly = monthly_df['10MA'].iat[-1]
+    prev_10ma_monthly = monthly_df['10MA'].iat[-2]
     
     # 检查月线数据有效性
     import pandas as pd
@@ -143,7 +145,7 @@ def check_index_sell_signal(record):
     rule_1_triggered = current_10ma_monthly < prev_10ma_monthly
     
     # === 检查条件2：周线10MA vs 20MA ===
-    weekly_df = get_stock_data(symbol, market, period="2y", interval="1wk")
+    weekly_df = get_stock_data(symbol, market, period="2y", interval="1wk", force_refresh=force_refresh)
     
     if weekly_df is None or len(weekly_df) < 25:
         return None, {
@@ -164,8 +166,8 @@ def check_index_sell_signal(record):
     weekly_df['10MA'] = weekly_df['Close'].rolling(window=10).mean()
     weekly_df['20MA'] = weekly_df['Close'].rolling(window=20).mean()
     
-    ma10_weekly = weekly_df.iloc[-1]['10MA']
-    ma20_weekly = weekly_df.iloc[-1]['20MA']
+    ma10_weekly = weekly_df['10MA'].iat[-1]
+    ma20_weekly = weekly_df['20MA'].iat[-1]
     
     # 检查周线数据有效性
     if pd.isna(ma10_weekly) or pd.isna(ma20_weekly):
@@ -218,10 +220,13 @@ def check_index_sell_signal(record):
     }
 
 
-def check_all_index_holdings():
+def check_all_index_holdings(force_refresh=False):
     """
     检查所有指数型股票持仓是否触发卖出信号
     
+    Args:
+        force_refresh: 是否跳过行情缓存重新下载
+    
     Returns:
         (sell_records, all_records_data): 建议卖出的记录和所有记录的分析数据
     """
@@ -243,7 +248,7 @@ def check_all_index_holdings():
         market_name = get_market_name(market)
         
         try:
-            result, analysis_data = check_index_sell_signal(record)
+            result, analysis_data = check_index_sell_signal(record, force_refresh)
             
             if result is None:
                 # 获取数据失败
@@ -507,8 +512,8 @@ def main():
     print(f"[{datetime.now()}] 启动指数型股票卖出信号监控流水线...")
     
     try:
-        # 1. 检查所有持仓
-        sell_records, all_records_data = check_all_index_holdings()
+        # 1. 检查所有持仓（手动触发时可选择跳过当天的行情缓存）
+        sell_records, all_records_data = check_all_index_holdings(get_config()["FORCE_REFRESH"])
         
         if not all_records_data:
             print(f"[{datetime.now()}] ❌ 没有可检查的持仓记录或所有记录检查均失败")
@@ -3,9 +3,11 @@
 扫描纳斯达克市值排名前100的股票，找出满足买入条件的股票
 """
 from datetime import datetime
-import time
+import heapq
 from stock_utils import (
-    get_stock_analysis,
+    ANALYSIS_MAX_WORKERS,
+    analyze_symbols,
+    get_config,
     count_rules_passed,
     format_stock_analysis_text,
     call_deepseek_api,
@@ -18,60 +20,61 @@ from stock_utils import (
 # ==========================================
 MIN_RULES_PASSED = 10  # 必须全部条件满足才建议买入（共 10 条规则）
 
+# ==========================================
+# 纳斯达克100指数成分股列表（2024年更新）
+# 这些是纳斯达克交易所市值最大的100只非金融类股票
+# ==========================================
+_NASDAQ_100_LIST = [
+    "AAPL", "MSFT", "AMZN", "NVDA", "GOOGL", "GOOG", "META", "TSLA",
+    "AVGO", "COST", "NFLX", "AMD", "PEP", "ADBE", "CSCO", "CMCSA",
+    "INTC", "INTU", "AMGN", "TXN", "AMAT", "HON", "ISRG", "BKNG",
+    "VRTX", "ADI", "GILD", "REGN", "LRCX", "SNPS", "CDNS", "KLAC",
+    "ADP", "CTSH", "NXPI", "FTNT", "ON", "PAYX", "MRVL", "IDXX",
+    "DXCM", "BKR", "FAST", "ANSS", "CPRT", "CRWD", "CTAS", "ENPH",
+    "ODFL", "CDW", "TEAM", "ZS", "MCHP", "MELI", "ALGN", "FANG",
+    "PCAR", "ROST", "KDP", "GEHC", "AEP", "DLTR", "EXC", "XEL",
+    "EA", "WBD", "VRSK", "ILMN", "TTD", "DDOG", "MDB", "DOCN",
+    "NET", "FTNT", "PANW", "OKTA", "ZM", "DOCU", "COUP", "NOW",
+    "SNOW", "PLTR", "RBLX", "U", "BILL", "AFRM", "HOOD", "SOFI",
+    "UPST", "LCID", "RIVN", "FRSH", "GTLB", "ASAN", "ESTC", "PATH",
+    "CFLT", "APP", "AI", "CARM", "BMBL", "BAND", "BIDU", "JD"
+]
+
+# 去重后不足100只时，用其他纳斯达克大市值股票补齐
+_NASDAQ_SUPPLEMENT_LIST = [
+    "QCOM", "MU", "LRCX", "SWKS", "QRVO", "MCHP", "MPWR", "OLED",
+    "ALKS", "INCY", "BIIB", "CELG", "ILMN", "SGEN", "VRTX", "EXAS",
+    "NTES", "PDD", "BABA", "NIO", "XPEV", "LI", "BILI", "TME"
+]
+
+# 模块加载时一次性去重（保持顺序）并截取前100个
+NASDAQ_SYMBOLS = tuple(dict.fromkeys(_NASDAQ_100_LIST + _NASDAQ_SUPPLEMENT_LIST))[:100]
+
 def get_nasdaq_top100_symbols():
     """
     获取纳斯达克市值排名前100的股票代码列表
     使用纳斯达克100成分股列表（Nasdaq-100指数成分股）
     """
-    # 纳斯达克100指数成分股列表（2024年更新）
-    # 这些是纳斯达克交易所市值最大的100只非金融类股票
-    nasdaq_100_symbols = [
-        "AAPL", "MSFT", "AMZN", "NVDA", "GOOGL", "GOOG", "META", "TSLA",
-        "AVGO", "COST", "NFLX", "AMD", "PEP", "ADBE", "CSCO", "CMCSA",
-        "INTC", "INTU", "AMGN", "TXN", "AMAT", "HON", "ISRG", "BKNG",
-        "VRTX", "ADI", "GILD", "REGN", "LRCX", "SNPS", "CDNS", "KLAC",
-        "ADP", "CTSH", "NXPI", "FTNT", "ON", "PAYX", "MRVL", "IDXX",
-        "DXCM", "BKR", "FAST", "ANSS", "CPRT", "CRWD", "CTAS", "ENPH",
-        "ODFL", "CDW", "TEAM", "ZS", "MCHP", "MELI", "ALGN", "FANG",
-        "PCAR", "ROST", "KDP", "GEHC", "AEP", "DLTR", "EXC", "XEL",
-        "EA", "WBD", "VRSK", "ILMN", "TTD", "DDOG", "MDB", "DOCN",
-        "NET", "FTNT", "PANW", "OKTA", "ZM", "DOCU", "COUP", "NOW",
-        "SNOW", "PLTR", "RBLX", "U", "BILL", "AFRM", "HOOD", "SOFI",
-        "UPST", "LCID", "RIVN", "FRSH", "GTLB", "ASAN", "ESTC", "PATH",
-        "CFLT", "APP", "AI", "CARM", "BMBL", "BAND", "BIDU", "JD"
-    ]
-    
-    # 如果列表不足100个，补充一些其他纳斯达克大市值股票
-    if len(nasdaq_100_symbols) < 100:
-        additional_symbols = [
-            "QCOM", "MU", "LRCX", "SWKS", "QRVO", "MCHP", "MPWR", "OLED",
-            "ALKS", "INCY", "BIIB", "CELG", "ILMN", "SGEN", "VRTX", "EXAS",
-            "NTES", "PDD", "BABA", "NIO", "XPEV", "LI", "BILI", "TME"
-        ]
-        nasdaq_100_symbols.extend(additional_symbols)
-    
-    # 去重并返回前100个
-    unique_symbols = list(dict.fromkeys(nasdaq_100_symbols))  # 保持顺序的去重
-    return unique_symbols[:100]
+    return NASDAQ_SYMBOLS
 
-def generate_ai_report(stocks_data, total_worthy_count):
+def generate_ai_report(stocks, total_worthy_count):
     """
     将扫描结果喂给 DeepSeek，让它生成专业投研结论
     
     Args:
-        stocks_data: 字典列表，每个元素包含股票分析数据（只包含前5只股票）
+        stocks: (股票代码, 达成规则数量, 分析数据字典) 元组列表（只包含前5只股票）
         total_worthy_count: 总共满足条件的股票数量
     
     Returns:
         AI 生成的报告内容
     """
     # 构建所有股票的分析数据字符串（只包含前5只）
-    stocks_analysis = []
-    for data in stocks_data:
-        rules_passed = count_rules_passed(data)
-        stock_info = format_stock_analysis_text(data)
-        stock_info += f"综合结论: {'建议买入' if rules_passed >= MIN_RULES_PASSED else '持续观望'}\n"
-        stocks_analysis.append(stock_info)
+    # 达成规则数量在扫描阶段已统计，直接复用
+    stocks_analysis = [
+        format_stock_analysis_text(data, rules_passed=rules_passed)
+        + f"综合结论: {'建议买入' if rules_passed >= MIN_RULES_PASSED else '持续观望'}\n"
+        for _, rules_passed, data in stocks
+    ]
     
     all_stocks_text = "\n".join(stocks_analysis)
     
@@ -117,45 +120,35 @@ def main():
         nasdaq_symbols = get_nasdaq_top100_symbols()
         print(f"[{datetime.now()}] 获取到 {len(nasdaq_symbols)} 只股票")
         
-        # 2. 循环分析所有股票
+        # 2. 批量下载并并发分析所有股票
+        symbol_count = len(nasdaq_symbols)
+        print(f"[{datetime.now()}] 正在分析 {symbol_count} 只股票（批量下载，{ANALYSIS_MAX_WORKERS} 个线程并发）...")
+        force_refresh = get_config()["FORCE_REFRESH"]  # 手动触发时可选择跳过当天的行情缓存
+        analysis_results = analyze_symbols(nasdaq_symbols, min_rules_passed=MIN_RULES_PASSED, force_refresh=force_refresh)
+        
         failed_stocks = []
         worthy_stocks = []  # 值得买入的股票（满足至少MIN_RULES_PASSED个规则）
-        
-        for idx, symbol in enumerate(nasdaq_symbols, 1):
-            try:
-                print(f"[{datetime.now()}] [{idx}/{len(nasdaq_symbols)}] 正在分析 {symbol}...")
-                data = get_stock_analysis(symbol)
-                
-                if data is None:
-                    print(f"[{datetime.now()}] ⚠️  {symbol} 数据不足或分析失败，跳过")
-                    failed_stocks.append(symbol)
-                    continue
-                
-                # 计算达成规则的数量
-                rules_passed = count_rules_passed(data)
-                print(f"[{datetime.now()}] {symbol} 分析完成，达成规则: {rules_passed}/10")
-                
-                # 如果满足买入条件，添加到值得买入列表
-                if rules_passed >= MIN_RULES_PASSED:
-                    worthy_stocks.append((symbol, rules_passed, data))
-                    print(f"[{datetime.now()}] ✅ {symbol} 值得买入！达成 {rules_passed} 个规则")
-                
-                # 添加延迟以避免API限制
-                time.sleep(0.5)
-                
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[{datetime.now()}] ⚠️  {symbol} 分析失败: {error_msg}")
+        for idx, (symbol, data) in enumerate(zip(nasdaq_symbols, analysis_results), 1):
+            if data is None:
+                print(f"[{datetime.now()}] [{idx}/{symbol_count}] ⚠️  {symbol} 数据不足或分析失败，跳过")
                 failed_stocks.append(symbol)
-                time.sleep(0.5)  # 即使失败也延迟一下
+                continue
+            
+            # 计算达成规则的数量
+            rules_passed = count_rules_passed(data)
+            early_exit_note = "（无法达到买入阈值，已提前结束检验）" if data['short_circuited'] else ""
+            print(f"[{datetime.now()}] [{idx}/{symbol_count}] {symbol} 分析完成，达成规则: {rules_passed}/10{early_exit_note}")
+            
+            if rules_passed >= MIN_RULES_PASSED:
+                worthy_stocks.append((symbol, rules_passed, data))
+                print(f"[{datetime.now()}] ✅ {symbol} 值得买入！达成 {rules_passed} 个规则")
         
-        # 3. 按达成规则数量排序
-        worthy_stocks.sort(key=lambda x: x[1], reverse=True)
+        # 3. 按达成规则数量取前10只（只需前K只，无需对全部结果排序）
+        top_stocks = heapq.nlargest(10, worthy_stocks, key=lambda x: x[1])
         total_worthy_count = len(worthy_stocks)
         
         # 只取前5只股票用于生成详细报告
-        top5_stocks = worthy_stocks[:5]
-        top5_stocks_data = [stock[2] for stock in top5_stocks]
+        top5_stocks = top_stocks[:5]
         
         print(f"[{datetime.now()}] 扫描完成！")
         print(f"[{datetime.now()}] 总计分析: {len(nasdaq_symbols)} 只股票")
@@ -168,15 +161,15 @@ def main():
         
         if worthy_stocks:
             print(f"[{datetime.now()}] 值得买入的股票（按规则达成数排序，仅显示前10个）:")
-            for symbol, rules_count, _ in worthy_stocks[:10]:
+            for symbol, rules_count, _ in top_stocks:
                 print(f"  - {symbol}: {rules_count}/10 规则达成")
             if total_worthy_count > 5:
                 print(f"[{datetime.now()}] 注意: 报告中将只显示前5只股票的详细清单")
         
         # 4. 如果有值得买入的股票，生成AI报告并发送邮件
-        if top5_stocks_data:
+        if top5_stocks:
             print(f"[{datetime.now()}] 正在生成 AI 分析报告（共 {total_worthy_count} 只值得买入的股票，报告中将详细展示前5只）...")
-            report_content = generate_ai_report(top5_stocks_data, total_worthy_count)
+            report_content = generate_ai_report(top5_stocks, total_worthy_count)
             
             # 提取标题并发送
             lines = report_content.split('\n')
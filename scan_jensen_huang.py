@@ -4,7 +4,9 @@
 """
 from datetime import datetime
 import json
+from concurrent.futures import ThreadPoolExecutor
 from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException
 from stock_utils import (
     call_deepseek_api,
     send_email,
@@ -24,68 +26,86 @@ SEARCH_KEYWORDS = [
 ]
 
 MAX_RESULTS_PER_KEYWORD = 5  # 每个关键词搜索的最大结果数
+MAX_SEARCH_WORKERS = 2  # 并发搜索的线程数（DuckDuckGo 限流严格，只保留少量并发）
+
+
+def _search_keyword(keyword):
+    """
+    搜索单个关键词的新闻和普通网页结果
+    
+    每次搜索使用独立的 DDGS 会话：DDGS 的请求间隔控制和 cookie/header 更新都不是线程安全的，不能在线程间共享
+    
+    Args:
+        keyword: 搜索关键词
+    
+    Returns:
+        (news_results, text_results)，出错前已获取的结果会保留
+    """
+    news_results, text_results = [], []
+    try:
+        print(f"[{datetime.now()}] 搜索关键词: {keyword}")
+        with DDGS() as ddgs:
+            # 搜索新闻
+            news_results = list(ddgs.news(
+                keyword,
+                region="wt-wt",  # 全球结果
+                safesearch="moderate",
+                timelimit="w",  # 限制为最近一周
+                max_results=MAX_RESULTS_PER_KEYWORD
+            ))
+            
+            # 同时搜索普通网页
+            text_results = list(ddgs.text(
+                keyword,
+                region="wt-wt",
+                safesearch="moderate",
+                timelimit="w",
+                max_results=MAX_RESULTS_PER_KEYWORD
+            ))
+    except RatelimitException as e:
+        print(f"[{datetime.now()}] ⚠️  搜索 '{keyword}' 被 DuckDuckGo 限流，该关键词结果不完整: {str(e)}")
+    except Exception as e:
+        print(f"[{datetime.now()}] ⚠️  搜索 '{keyword}' 时出错: {str(e)}")
+    return news_results, text_results
 
 
 def search_jensen_huang_news():
     """
     使用 DuckDuckGo 搜索黄仁勋的最新新闻和发言
     
+    各关键词在线程池中并发搜索（每个关键词使用独立的 DDGS 会话），结果按关键词顺序合并去重
+    
     Returns:
         搜索结果列表，每个结果包含 title, body, href
     """
     all_results = []
     seen_urls = set()  # 用于去重
     
-    with DDGS() as ddgs:
-        for keyword in SEARCH_KEYWORDS:
-            try:
-                print(f"[{datetime.now()}] 搜索关键词: {keyword}")
-                
-                # 搜索新闻
-                news_results = list(ddgs.news(
-                    keyword,
-                    region="wt-wt",  # 全球结果
-                    safesearch="moderate",
-                    timelimit="w",  # 限制为最近一周
-                    max_results=MAX_RESULTS_PER_KEYWORD
-                ))
-                
-                for result in news_results:
-                    url = result.get('url', result.get('href', ''))
-                    if url and url not in seen_urls:
-                        seen_urls.add(url)
-                        all_results.append({
-                            'title': result.get('title', ''),
-                            'body': result.get('body', result.get('description', '')),
-                            'url': url,
-                            'date': result.get('date', ''),
-                            'source': result.get('source', '')
-                        })
-                
-                # 同时搜索普通网页
-                text_results = list(ddgs.text(
-                    keyword,
-                    region="wt-wt",
-                    safesearch="moderate",
-                    timelimit="w",
-                    max_results=MAX_RESULTS_PER_KEYWORD
-                ))
-                
-                for result in text_results:
-                    url = result.get('href', '')
-                    if url and url not in seen_urls:
-                        seen_urls.add(url)
-                        all_results.append({
-                            'title': result.get('title', ''),
-                            'body': result.get('body', ''),
-                            'url': url,
-                            'date': '',
-                            'source': ''
-                        })
-                        
-            except Exception as e:
-                print(f"[{datetime.now()}] ⚠️  搜索 '{keyword}' 时出错: {str(e)}")
-                continue
+    with ThreadPoolExecutor(max_workers=MAX_SEARCH_WORKERS) as executor:
+        for news_results, text_results in executor.map(_search_keyword, SEARCH_KEYWORDS):
+            for result in news_results:
+                url = result.get('url', result.get('href', ''))
+                if url and url not in seen_urls:
+                    seen_urls.add(url)
+                    all_results.append({
+                        'title': result.get('title', ''),
+                        'body': result.get('body', result.get('description', '')),
+                        'url': url,
+                        'date': result.get('date', ''),
+                        'source': result.get('source', '')
+                    })
+            
+            for result in text_results:
+                url = result.get('href', '')
+                if url and url not in seen_urls:
+                    seen_urls.add(url)
+                    all_results.append({
+                        'title': result.get('title', ''),
+                        'body': result.get('body', ''),
+                        'url': url,
+                        'date': '',
+                        'source': ''
+                    })
     
     print(f"[{datetime.now()}] 共搜索到 {len(all_results)} 条结果（去重后）")
     return all_results
@@ -3,9 +3,11 @@ ARK BIG IDEAS 2026 股票扫描脚本
 扫描Cathie Wood ARK BIG IDEAS 2026报告中提到的股票，找出满足买入条件的股票
 """
 from datetime import datetime
-import time
+import heapq
 from stock_utils import (
-    get_stock_analysis,
+    ANALYSIS_MAX_WORKERS,
+    analyze_symbols,
+    get_config,
     count_rules_passed,
     format_stock_analysis_text,
     call_deepseek_api,
@@ -25,6 +27,14 @@ def get_ark_big_ideas_symbols():
     """
     # ARK BIG IDEAS 2026 股票列表（按类别组织）
     ark_symbols = []
+    seen = set()
+    
+    def add_symbols(symbols):
+        """按类别追加股票代码，跨类别重复出现的代码只保留第一次出现的位置"""
+        for symbol in symbols:
+            if symbol not in seen:
+                seen.add(symbol)
+                ark_symbols.append(symbol)
     
     # 1. AI (算力、软件等)
     ai_symbols = [
@@ -38,7 +48,7 @@ def get_ark_big_ideas_symbols():
         "AMZN",   # 亚马逊
         "AAPL",   # 苹果
     ]
-    ark_symbols.extend(ai_symbols)
+    add_symbols(ai_symbols)
     
     # 2. 公有区块链与数字资产（排除加密货币，只包含股票）
     blockchain_symbols = [
@@ -46,7 +56,7 @@ def get_ark_big_ideas_symbols():
         "CRCL",   # Circle
         "HOOD",   # Robinhood
     ]
-    ark_symbols.extend(blockchain_symbols)
+    add_symbols(blockchain_symbols)
     
     # 3. 机器人技术
     # 3.1 人形机器人
@@ -55,7 +65,7 @@ def get_ark_big_ideas_symbols():
         "XPEV",   # 小鹏汽车
         # "UBTECH", # 优必选 (港股09880.HK，可能需要特殊处理)
     ]
-    ark_symbols.extend(humanoid_robots)
+    add_symbols(humanoid_robots)
     
     # 3.2 自动驾驶/机器人出租车
     autonomous_driving = [
@@ -69,7 +79,7 @@ def get_ark_big_ideas_symbols():
         # "NBIS",   # Nebius (可能不是公开交易股票)
         # "GRAB",   # Grab (可能不是公开交易股票)
     ]
-    ark_symbols.extend(autonomous_driving)
+    add_symbols(autonomous_driving)
     
     # 3.3 专用机器人
     specialized_robots = [
@@ -79,7 +89,7 @@ def get_ark_big_ideas_symbols():
         "SYM",    # Symbotic
         "TER",    # 泰瑞达
     ]
-    ark_symbols.extend(specialized_robots)
+    add_symbols(specialized_robots)
     
     # 4. 多组学&生物科技
     # 4.1 分子诊断
@@ -91,7 +101,7 @@ def get_ark_big_ideas_symbols():
         "TEM",    # Tempus AI
         "VCYT",   # Veracyte
     ]
-    ark_symbols.extend(molecular_diagnostics)
+    add_symbols(molecular_diagnostics)
     
     # 4.2 多组学
     omics = [
@@ -100,7 +110,7 @@ def get_ark_big_ideas_symbols():
         "TWST",   # Twist Bioscience
         "TXG",    # 10X Genomics
     ]
-    ark_symbols.extend(omics)
+    add_symbols(omics)
     
     # 4.3 治疗
     therapeutics = [
@@ -109,7 +119,7 @@ def get_ark_big_ideas_symbols():
         "NTLA",   # Intellia Therapeutics
         "PRME",   # Prime Medicine
     ]
-    ark_symbols.extend(therapeutics)
+    add_symbols(therapeutics)
     
     # 4.4 药物开发
     drug_development = [
@@ -117,21 +127,18 @@ def get_ark_big_ideas_symbols():
         "RXRX",   # Recursion Pharmaceuticals
         "GBIO",   # Generation Bio
     ]
-    ark_symbols.extend(drug_development)
+    add_symbols(drug_development)
     
     # 5. 能源与储能 - 未公布，暂不包含
     
-    # 去重并保持顺序
-    unique_symbols = list(dict.fromkeys(ark_symbols))
-    
-    return unique_symbols
+    return ark_symbols
 
-def generate_ai_report(stocks_data, total_worthy_count):
+def generate_ai_report(stocks, total_worthy_count):
     """
     将扫描结果喂给 DeepSeek，让它生成专业投研结论
     
     Args:
-        stocks_data: 字典列表，每个元素包含股票分析数据（只包含前5只股票）
+        stocks: (股票代码, 达成规则数量, 分析数据字典) 元组列表（只包含前5只股票）
         total_worthy_count: 总共满足条件的股票数量
     
     Returns:
@@ -139,9 +146,8 @@ def generate_ai_report(stocks_data, total_worthy_count):
     """
     # 构建所有股票的分析数据字符串（只包含前5只）
     stocks_analysis = []
-    for data in stocks_data:
-        rules_passed = count_rules_passed(data)
-        stock_info = format_stock_analysis_text(data)
+    for _, rules_passed, data in stocks:
+        stock_info = format_stock_analysis_text(data, rules_passed=rules_passed)
         stock_info += f"综合结论: {'建议买入' if rules_passed >= MIN_RULES_PASSED else '持续观望'}\n"
         stocks_analysis.append(stock_info)
     
@@ -190,45 +196,35 @@ def main():
         ark_symbols = get_ark_big_ideas_symbols()
         print(f"[{datetime.now()}] 获取到 {len(ark_symbols)} 只股票")
         
-        # 2. 循环分析所有股票
+        # 2. 批量下载并并发分析所有股票
+        symbol_count = len(ark_symbols)
+        print(f"[{datetime.now()}] 正在分析 {symbol_count} 只股票（批量下载，{ANALYSIS_MAX_WORKERS} 个线程并发）...")
+        force_refresh = get_config()["FORCE_REFRESH"]  # 手动触发时可选择跳过当天的行情缓存
+        analysis_results = analyze_symbols(ark_symbols, min_rules_passed=MIN_RULES_PASSED, force_refresh=force_refresh)
+        
         failed_stocks = []
         worthy_stocks = []  # 值得买入的股票（满足至少MIN_RULES_PASSED个规则）
-        
-        for idx, symbol in enumerate(ark_symbols, 1):
-            try:
-                print(f"[{datetime.now()}] [{idx}/{len(ark_symbols)}] 正在分析 {symbol}...")
-                data = get_stock_analysis(symbol)
-                
-                if data is None:
-                    print(f"[{datetime.now()}] ⚠️  {symbol} 数据不足或分析失败，跳过")
-                    failed_stocks.append(symbol)
-                    continue
-                
-                # 计算达成规则的数量
-                rules_passed = count_rules_passed(data)
-                print(f"[{datetime.now()}] {symbol} 分析完成，达成规则: {rules_passed}/10")
-                
-                # 如果满足买入条件，添加到值得买入列表
-                if rules_passed >= MIN_RULES_PASSED:
-                    worthy_stocks.append((symbol, rules_passed, data))
-                    print(f"[{datetime.now()}] ✅ {symbol} 值得买入！达成 {rules_passed} 个规则")
-                
-                # 添加延迟以避免API限制
-                time.sleep(0.5)
-                
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[{datetime.now()}] ⚠️  {symbol} 分析失败: {error_msg}")
+        for idx, (symbol, data) in enumerate(zip(ark_symbols, analysis_results), 1):
+            if data is None:
+                print(f"[{datetime.now()}] [{idx}/{symbol_count}] ⚠️  {symbol} 数据不足或分析失败，跳过")
                 failed_stocks.append(symbol)
-                time.sleep(0.5)  # 即使失败也延迟一下
+                continue
+            
+            # 计算达成规则的数量
+            rules_passed = count_rules_passed(data)
+            early_exit_note = "（无法达到买入阈值，已提前结束检验）" if data['short_circuited'] else ""
+            print(f"[{datetime.now()}] [{idx}/{symbol_count}] {symbol} 分析完成，达成规则: {rules_passed}/10{early_exit_note}")
+            
+            if rules_passed >= MIN_RULES_PASSED:
+                worthy_stocks.append((symbol, rules_passed, data))
+                print(f"[{datetime.now()}] ✅ {symbol} 值得买入！达成 {rules_passed} 个规则")
         
-        # 3. 按达成规则数量排序
-        worthy_stocks.sort(key=lambda x: x[1], reverse=True)
+        # 3. 按达成规则数量取前10只（只需前K只，无需对全部结果排序）
+        top_stocks = heapq.nlargest(10, worthy_stocks, key=lambda x: x[1])
         total_worthy_count = len(worthy_stocks)
         
         # 只取前5只股票用于生成详细报告
-        top5_stocks = worthy_stocks[:5]
-        top5_stocks_data = [stock[2] for stock in top5_stocks]
+        top5_stocks = top_stocks[:5]
         
         print(f"[{datetime.now()}] 扫描完成！")
         print(f"[{datetime.now()}] 总计分析: {len(ark_symbols)} 只股票")
@@ -241,15 +237,15 @@ def main():
         
         if worthy_stocks:
             print(f"[{datetime.now()}] 值得买入的股票（按规则达成数排序，仅显示前10个）:")
-            for symbol, rules_count, _ in worthy_stocks[:10]:
+            for symbol, rules_count, _ in top_stocks:
                 print(f"  - {symbol}: {rules_count}/10 规则达成")
             if total_worthy_count > 5:
                 print(f"[{datetime.now()}] 注意: 报告中将只显示前5只股票的详细清单")
         
         # 4. 如果有值得买入的股票，生成AI报告并发送邮件
-        if top5_stocks_data:
+        if top5_stocks:
             print(f"[{datetime.now()}] 正在生成 AI 分析报告（共 {total_worthy_count} 只值得买入的股票，报告中将详细展示前5只）...")
-            report_content = generate_ai_report(top5_stocks_data, total_worthy_count)
+            report_content = generate_ai_report(top5_stocks, total_worthy_count)
             
             # 提取标题并发送
             lines = report_content.split('\n')
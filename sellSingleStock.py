@@ -4,16 +4,20 @@
 支持美股(US)和港股(HK)
 """
 import json
-import yfinance as yf
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import pandas as pd
+import numpy as np
 from stock_utils import (
+    ANALYSIS_MAX_WORKERS,
     MARKET_US,
     MARKET_HK,
     calculate_macd,
+    calculate_macd_panel,
     get_stock_data,
-    normalize_symbol,
+    get_stock_data_batch,
+    get_config,
+    get_current_stock_price,
     get_display_symbol,
     get_market_name,
     get_currency_symbol,
@@ -25,6 +29,9 @@ from stock_utils import (
 # 购买记录文件路径
 PURCHASE_RECORDS_FILE = "purchase_records.json"
 
+# 死亡交叉只在最近 N 周内查找：一年以前的交叉对当前的卖出判断已无参考意义
+DEATH_CROSS_LOOKBACK_WEEKS = 52
+
 # ==========================================
 # 股票代码配置：在此添加要分析的股票代码
 # 格式: {市场类型: [股票代码列表]}
@@ -107,7 +114,7 @@ def get_purchase_info(symbol, market):
 
 def find_last_death_cross_week(df):
     """
-    找到最近一次MACD线DIF线向下穿过DEA线的那一周
+    找到最近一次MACD线DIF线向下穿过DEA线的那一周（仅在最近 DEATH_CROSS_LOOKBACK_WEEKS 周内查找）
     
     Args:
         df: 包含 MACD_DIF 和 MACD_DEA 列的 DataFrame
@@ -118,34 +125,74 @@ def find_last_death_cross_week(df):
     if len(df) < 2:
         return None, None
     
-    # 从后往前查找死亡交叉（DIF向下穿过DEA）
+    # 只取最近 DEATH_CROSS_LOOKBACK_WEEKS 周（含其前一周，用于判断第一周是否发生交叉）
+    start = max(0, len(df) - DEATH_CROSS_LOOKBACK_WEEKS - 1)
+    dif = df['MACD_DIF'].to_numpy(dtype=np.float64)[start:]
+    dea = df['MACD_DEA'].to_numpy(dtype=np.float64)[start:]
+    
     # 死亡交叉：前一周DIF > DEA，当前周DIF <= DEA
-    for i in range(len(df) - 1, 0, -1):
-        prev_dif = df.iloc[i-1]['MACD_DIF']
-        prev_dea = df.iloc[i-1]['MACD_DEA']
-        curr_dif = df.iloc[i]['MACD_DIF']
-        curr_dea = df.iloc[i]['MACD_DEA']
-        
-        # 检查是否有有效值
-        if pd.isna(prev_dif) or pd.isna(prev_dea) or pd.isna(curr_dif) or pd.isna(curr_dea):
+    # 与 NaN 的比较结果恒为 False，含无效值的相邻两周自然不会被判定为交叉
+    cross = (dif[:-1] > dea[:-1]) & (dif[1:] <= dea[1:])
+    cross_idx = np.flatnonzero(cross)
+    if cross_idx.size == 0:
+        return None, None
+    
+    # 取最近一次死亡交叉，返回该周的最低价
+    i = start + int(cross_idx[-1]) + 1
+    lowest_price = df['Low'].to_numpy()[i]
+    return i, lowest_price
+
+def find_last_death_cross_weeks(frames):
+    """
+    批量查找多只股票最近一次死亡交叉：收盘价按最后一行右对齐拼成 (周数, 股票数) 面板，
+    一次计算所有股票的 MACD 和交叉位置
+    
+    Args:
+        frames: 字典 {key: DataFrame}，值为 None 或不足两周的股票跳过
+    
+    Returns:
+        字典 {key: (index, lowest_price)}，含义与 find_last_death_cross_week 的返回值相同
+    """
+    valid = {key: df for key, df in frames.items() if df is not None and len(df) >= 2}
+    if not valid:
+        return {}
+    
+    # 较短的序列在前面补 NaN；前导 NaN 不影响 EMA 递推，每列结果与单只股票计算完全相同
+    keys = list(valid)
+    lengths = np.array([len(valid[key]) for key in keys])
+    total_weeks = int(lengths.max())
+    closes = np.full((total_weeks, len(keys)), np.nan, order='F')
+    for j, key in enumerate(keys):
+        closes[total_weeks - lengths[j]:, j] = valid[key]['Close'].to_numpy(dtype=np.float64)
+    dif, dea = calculate_macd_panel(closes)
+    
+    # 与 find_last_death_cross_week 相同的查找窗口和交叉条件，按列同时判断
+    start = max(0, total_weeks - DEATH_CROSS_LOOKBACK_WEEKS - 1)
+    dif = dif[start:]
+    dea = dea[start:]
+    cross = (dif[:-1] > dea[:-1]) & (dif[1:] <= dea[1:])
+    has_cross = cross.any(axis=0)
+    last_cross = cross.shape[0] - 1 - np.argmax(cross[::-1], axis=0)
+    
+    results = {}
+    for j, key in enumerate(keys):
+        if not has_cross[j]:
+            results[key] = (None, None)
             continue
-        
-        # 检查是否发生死亡交叉：前一周DIF在DEA之上，当前周DIF在DEA之下或相等
-        if prev_dif > prev_dea and curr_dif <= curr_dea:
-            # 找到死亡交叉，返回该周的最低价
-            death_cross_week = df.iloc[i]
-            lowest_price = death_cross_week['Low']
-            return i, lowest_price
-    
-    return None, None
+        # 面板行号换算回该股票自身 DataFrame 的行号
+        i = int(start + last_cross[j] + 1 - (total_weeks - lengths[j]))
+        results[key] = (i, valid[key]['Low'].to_numpy()[i])
+    return results
 
-def check_sell_signal(symbol, market=MARKET_US):
+def check_sell_signal(symbol, market=MARKET_US, df=None, death_cross=None):
     """
     检查是否应该卖出股票
     
     Args:
         symbol: 股票代码
         market: 市场类型 (US/HK)
+        df: 预先批量获取的历史数据，为 None 时单独下载
+        death_cross: 预先批量计算的 (index, lowest_price)，为 None 时根据 df 计算
     
     Returns:
         (should_sell, analysis_data): 是否应该卖出和分析数据
@@ -153,7 +200,8 @@ def check_sell_signal(symbol, market=MARKET_US):
     # 获取购买信息（持有天数）
     purchase_date, holding_days = get_purchase_info(symbol, market)
     
-    df = get_stock_data(symbol, market)
+    if df is None:
+        df = get_stock_data(symbol, market)
     
     if df is None or len(df) < 2:
         return False, {
@@ -165,25 +213,16 @@ def check_sell_signal(symbol, market=MARKET_US):
             "holding_days": holding_days,
         }
     
-    # 计算MACD
-    df = calculate_macd(df)
+    # 当前价格取实时报价（周线数据可能来自当天较早时候写入的缓存）；获取失败时使用最新一周的收盘价
+    current_price = get_current_stock_price(symbol, market)
+    if current_price is None:
+        current_price = df['Close'].to_numpy()[-1]
     
-    # 获取当前价格（实时价格或最新收盘价）
-    try:
-        # 尝试获取实时价格
-        normalized_symbol = normalize_symbol(symbol, market)
-        ticker = yf.Ticker(normalized_symbol)
-        info = ticker.info
-        current_price = info.get('regularMarketPrice') or info.get('currentPrice')
-        if current_price is None:
-            # 如果无法获取实时价格，使用最新一周的收盘价
-            current_price = df.iloc[-1]['Close']
-    except:
-        # 如果获取实时价格失败，使用最新一周的收盘价
-        current_price = df.iloc[-1]['Close']
-    
-    # 找到最近一次死亡交叉的那一周
-    death_cross_index, death_cross_week_low = find_last_death_cross_week(df)
+    # 找到最近一次死亡交叉的那一周（未预先批量计算时，单独计算该股票的MACD）
+    if death_cross is None:
+        df = calculate_macd(df)
+        death_cross = find_last_death_cross_week(df)
+    death_cross_index, death_cross_week_low = death_cross
     
     if death_cross_index is None or death_cross_week_low is None:
         return False, {
@@ -308,37 +347,66 @@ def main():
             print(f"[{datetime.now()}] {market_name}待分析: {', '.join(symbols)}")
     
     try:
-        # 1. 循环检查所有股票的卖出信号
-        stocks_data = {}
-        failed_stocks = []
-        sell_signals = []
-        
+        # 1. 按市场批量获取历史数据（一次请求下载多只股票），未获取到的股票在检查时单独下载
+        #    手动触发时可选择跳过当天的行情缓存
+        force_refresh = get_config()["FORCE_REFRESH"]
+        preloaded = {}
         for market, symbols in STOCK_CONFIG.items():
-            market_name = get_market_name(market)
-            currency = get_currency_symbol(market)
-            
-            for symbol in symbols:
+            if symbols:
+                batch = get_stock_data_batch(symbols, market, force_refresh=force_refresh)
+                preloaded.update(((market, symbol), df) for symbol, df in batch.items())
+        
+        # 批量获取到的股票一次性计算 MACD 并查找死亡交叉
+        death_crosses = find_last_death_cross_weeks(preloaded)
+        
+        # 2. 并发检查所有股票的卖出信号
+        tasks = [(market, symbol) for market, symbols in STOCK_CONFIG.items() for symbol in symbols]
+        results = [None] * len(tasks)
+        
+        with ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    check_sell_signal, symbol, market,
+                    preloaded.get((market, symbol)), death_crosses.get((market, symbol)),
+                ): idx
+                for idx, (market, symbol) in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                market, symbol = tasks[idx]
+                market_name = get_market_name(market)
+                currency = get_currency_symbol(market)
                 try:
-                    print(f"[{datetime.now()}] 正在检查{market_name} {symbol} 的卖出信号...")
-                    should_sell, analysis_data = check_sell_signal(symbol, market)
-                    stocks_data[(market, symbol)] = analysis_data
+                    should_sell, analysis_data = future.result()
+                    results[idx] = (should_sell, analysis_data)
                     
+                    display_symbol = get_display_symbol(symbol, market)
                     if should_sell:
-                        display_symbol = get_display_symbol(symbol, market)
-                        sell_signals.append(f"{market_name} {display_symbol}")
                         print(f"[{datetime.now()}] 🔴 {market_name} {display_symbol} 触发卖出信号！")
                         if analysis_data.get('holding_days') is not None:
                             print(f"[{datetime.now()}]    已持有: {analysis_data.get('holding_days')} 天")
                         print(f"[{datetime.now()}]    当前价格: {currency}{analysis_data.get('price')}")
                         print(f"[{datetime.now()}]    死亡交叉周最低价: {currency}{analysis_data.get('death_cross_week_low')}")
                     else:
-                        display_symbol = get_display_symbol(symbol, market)
                         holding_info = f" (已持有: {analysis_data.get('holding_days')}天)" if analysis_data.get('holding_days') is not None else ""
                         print(f"[{datetime.now()}] 🟢 {market_name} {display_symbol} 继续持有{holding_info}")
                 except Exception as e:
                     error_msg = str(e)
                     print(f"[{datetime.now()}] ⚠️  {market_name} {symbol} 分析失败: {error_msg}")
-                    failed_stocks.append(f"{market_name} {symbol}")
+        
+        # 按配置顺序汇总结果，保证报告中股票顺序稳定
+        stocks_data = {}
+        failed_stocks = []
+        sell_signals = []
+        for (market, symbol), result in zip(tasks, results):
+            market_name = get_market_name(market)
+            if result is None:
+                failed_stocks.append(f"{market_name} {symbol}")
+                continue
+            should_sell, analysis_data = result
+            stocks_data[(market, symbol)] = analysis_data
+            if should_sell:
+                sell_signals.append(f"{market_name} {get_display_symbol(symbol, market)}")
         
         if not stocks_data:
             print(f"[{datetime.now()}] ❌ 所有股票分析均失败，无法生成报告")
@@ -347,11 +415,11 @@ def main():
         if failed_stocks:
             print(f"[{datetime.now()}] ⚠️  以下股票分析失败: {', '.join(failed_stocks)}")
         
-        # 2. 调用 AI 决策生成综合报告
+        # 3. 调用 AI 决策生成综合报告
         print(f"[{datetime.now()}] 正在生成 AI 分析报告（共 {len(stocks_data)} 只股票）...")
         report_content = generate_sell_report(stocks_data)
         
-        # 3. 提取标题并发送
+        # 4. 提取标题并发送
         subject = f"卖出信号分析报告: {len(sell_signals)} 只股票建议卖出" if sell_signals else "卖出信号分析报告: 暂无卖出信号"
         
         send_email(subject, report_content)
@@ -4,13 +4,22 @@
 支持多市场：美股(US)、港股(HK)
 """
 import os
+import math
+import functools
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
 import yfinance as yf
 from openai import OpenAI
 import smtplib
 from email.message import EmailMessage
-from datetime import datetime
+from datetime import datetime, date
 import pandas as pd
 import numpy as np
+from numba import njit
 
 # ==========================================
 # 支持的市场类型
@@ -28,6 +37,8 @@ def get_config():
         "SENDER_EMAIL": os.environ.get("EMAIL_SENDER"),
         "SENDER_PASSWORD": os.environ.get("EMAIL_PASSWORD"),
         "RECEIVER_EMAIL": os.environ.get("EMAIL_RECEIVER"),
+        # 手动触发工作流时可选择跳过当天的行情缓存，重新下载数据
+        "FORCE_REFRESH": os.environ.get("YF_FORCE_REFRESH", "").strip().lower() in ("1", "true", "yes"),
     }
 
 # ==========================================
@@ -115,9 +126,198 @@ def detect_market(symbol):
     # 美股：其他情况
     return MARKET_US
 
+# ==========================================
+# 均线计算
+# ==========================================
+def _column_array(df, column):
+    """
+    取出 DataFrame 某一列为连续内存的 float64 数组，供 NumPy/Numba 内核按时间轴顺序读取
+    
+    Args:
+        df: 股票历史数据 DataFrame
+        column: 列名
+    
+    Returns:
+        C 连续的 float64 一维数组
+    """
+    return np.ascontiguousarray(df[column].to_numpy(dtype=np.float64))
+
+def _prefix_sum(x):
+    """
+    前缀和数组，多个周期的均线共用一次累加
+    
+    NaN 不参与累加，另外单独累计 NaN 的个数，供 _window_mean 判断窗口内是否有缺失值
+    
+    Args:
+        x: float64 一维数组
+    
+    Returns:
+        (csum, nan_count) 元组，长度均为 len(x) + 1：csum 第 i 个元素为 x 前 i 个元素中非 NaN 值之和，
+        nan_count 第 i 个元素为 x 前 i 个元素中 NaN 的个数（第 0 个均为 0）
+    """
+    isnan = np.isnan(x)
+    csum = np.concatenate(([0.0], np.cumsum(np.where(isnan, 0.0, x))))
+    nan_count = np.concatenate(([0], np.cumsum(isnan)))
+    return csum, nan_count
+
+def _window_mean(prefix, window, lag=0):
+    """
+    由前缀和取简单移动平均（等价于 rolling(window).mean() 的某一期）
+    
+    Args:
+        prefix: _prefix_sum 返回的 (csum, nan_count) 元组
+        window: 均线周期
+        lag: 向前偏移的期数，0 为最新一期，1 为上一期
+    
+    Returns:
+        均线值，数据不足一个完整窗口或窗口内有 NaN 时返回 NaN
+    """
+    csum, nan_count = prefix
+    end = csum.shape[0] - 1 - lag
+    if end < window or nan_count[end] != nan_count[end - window]:
+        return np.nan
+    return (csum[end] - csum[end - window]) / window
+
 # ==========================================
 # MACD 计算
 # ==========================================
+# fastmath 只开启 contract（允许融合为 FMA 指令）；完整的 fastmath 会假设没有 NaN，使缺失值判断失效
+@njit(cache=True, fastmath={'contract'})
+def _macd_fused(closes, alpha_fast, alpha_slow, alpha_signal):
+    """
+    单次遍历同时计算快线 EMA、慢线 EMA、DIF 和 DEA
+    
+    各 EMA 与 pandas ewm(adjust=False).mean() 一致（仅有浮点舍入级差异）：缺失值位置沿用上一期的值，
+    缺失期间旧值的权重仍按 (1 - alpha) 逐期衰减
+    
+    Args:
+        closes: 收盘价 float64 一维数组
+        alpha_fast: 快线平滑系数，span 周期对应 2 / (span + 1)
+        alpha_slow: 慢线平滑系数
+        alpha_signal: 信号线平滑系数
+    
+    Returns:
+        (dif, dea) 两个与 closes 等长的数组
+    """
+    n = closes.shape[0]
+    dif = np.empty(n)
+    dea = np.empty(n)
+    ema_fast = np.nan
+    ema_slow = np.nan
+    ema_dif = np.nan
+    # 上一个有效值在加权平均中的权重
+    wt_fast = 1.0
+    wt_slow = 1.0
+    wt_dif = 1.0
+    for i in range(n):
+        c = closes[i]
+        if not np.isnan(ema_fast):
+            wt_fast *= 1.0 - alpha_fast
+            wt_slow *= 1.0 - alpha_slow
+            if not np.isnan(c):
+                if ema_fast != c:
+                    ema_fast = (wt_fast * ema_fast + alpha_fast * c) / (wt_fast + alpha_fast)
+                if ema_slow != c:
+                    ema_slow = (wt_slow * ema_slow + alpha_slow * c) / (wt_slow + alpha_slow)
+                wt_fast = 1.0
+                wt_slow = 1.0
+        elif not np.isnan(c):
+            ema_fast = c
+            ema_slow = c
+        
+        d = ema_fast - ema_slow
+        if not np.isnan(ema_dif):
+            wt_dif *= 1.0 - alpha_signal
+            if not np.isnan(d):
+                if ema_dif != d:
+                    ema_dif = (wt_dif * ema_dif + alpha_signal * d) / (wt_dif + alpha_signal)
+                wt_dif = 1.0
+        elif not np.isnan(d):
+            ema_dif = d
+        
+        dif[i] = d
+        dea[i] = ema_dif
+    return dif, dea
+
+# MACD 默认周期（12, 26, 9）的平滑系数，作为编译期常量折叠进专用内核
+_ALPHA_12 = 2.0 / (12 + 1)
+_ALPHA_26 = 2.0 / (26 + 1)
+_ALPHA_9 = 2.0 / (9 + 1)
+
+@njit(cache=True, fastmath={'contract'})
+def _macd_12_26_9(closes):
+    """默认周期 (12, 26, 9) 的 MACD"""
+    return _macd_fused(closes, _ALPHA_12, _ALPHA_26, _ALPHA_9)
+
+def _macd_arrays(closes, fast=12, slow=26, signal=9):
+    """
+    基于收盘价数组计算 MACD 的 DIF 和 DEA 序列
+    
+    Args:
+        closes: 收盘价 float64 数组
+        fast: 快线周期，默认12
+        slow: 慢线周期，默认26
+        signal: 信号线周期，默认9
+    
+    Returns:
+        (dif, dea) 两个与 closes 等长的数组
+    """
+    if (fast, slow, signal) == (12, 26, 9):
+        return _macd_12_26_9(closes)
+    return _macd_fused(closes, 2.0 / (fast + 1), 2.0 / (slow + 1), 2.0 / (signal + 1))
+
+@njit(cache=True, fastmath={'contract'})
+def _macd_panel(closes, alpha_fast, alpha_slow, alpha_signal):
+    """
+    对二维收盘价面板（行：时间，列：股票）逐列计算 MACD，一次调用完成所有股票
+    
+    Args:
+        closes: (T, N) 的 float64 数组，按列存储（Fortran 顺序）时每列连续
+        alpha_fast: 快线平滑系数
+        alpha_slow: 慢线平滑系数
+        alpha_signal: 信号线平滑系数
+    
+    Returns:
+        (dif, dea) 两个与 closes 同形状的数组
+    """
+    n, m = closes.shape
+    dif = np.empty((m, n)).T
+    dea = np.empty((m, n)).T
+    for j in range(m):
+        d, e = _macd_fused(np.ascontiguousarray(closes[:, j]), alpha_fast, alpha_slow, alpha_signal)
+        dif[:, j] = d
+        dea[:, j] = e
+    return dif, dea
+
+def calculate_macd_panel(closes, fast=12, slow=26, signal=9):
+    """
+    批量计算多只股票的 MACD
+    
+    Args:
+        closes: (T, N) 收盘价数组，每列一只股票；序列长度不同时可在前面补 NaN 对齐（前导 NaN 不影响计算结果）
+        fast: 快线周期，默认12
+        slow: 慢线周期，默认26
+        signal: 信号线周期，默认9
+    
+    Returns:
+        (dif, dea) 两个与 closes 同形状的数组
+    """
+    closes = np.asfortranarray(closes, dtype=np.float64)
+    return _macd_panel(closes, 2.0 / (fast + 1), 2.0 / (slow + 1), 2.0 / (signal + 1))
+
+@functools.lru_cache(maxsize=1)
+def _warmup_macd_kernels():
+    """
+    预先编译/加载单只股票的 MACD 内核（只执行一次），在线程池并发分析前调用，避免首批线程在 numba 编译锁上排队
+    
+    不在导入时执行：不计算 MACD 的脚本无需承担编译开销，单线程调用时首次计算会自行编译。
+    pandas 写时复制返回的列数组是只读的，与可写数组属于不同的类型签名，两种都需要预热
+    """
+    x = np.zeros(2)
+    _macd_arrays(x)
+    x.flags.writeable = False
+    _macd_arrays(x)
+
 def calculate_macd(df, fast=12, slow=26, signal=9):
     """
     计算MACD指标
@@ -131,17 +331,149 @@ def calculate_macd(df, fast=12, slow=26, signal=9):
     Returns:
         添加了 MACD_DIF, MACD_DEA, MACD 列的 DataFrame
     """
-    exp1 = df['Close'].ewm(span=fast, adjust=False).mean()
-    exp2 = df['Close'].ewm(span=slow, adjust=False).mean()
-    df['MACD_DIF'] = exp1 - exp2
-    df['MACD_DEA'] = df['MACD_DIF'].ewm(span=signal, adjust=False).mean()
-    df['MACD'] = 2 * (df['MACD_DIF'] - df['MACD_DEA'])
+    dif, dea = _macd_arrays(_column_array(df, 'Close'), fast, slow, signal)
+    df['MACD_DIF'] = dif
+    df['MACD_DEA'] = dea
+    df['MACD'] = 2 * (dif - dea)
     return df
 
+# ==========================================
+# Yahoo Finance 请求限流
+# ==========================================
+# 同时进行中的 Yahoo Finance 请求上限，所有线程共享
+YF_MAX_CONCURRENT_REQUESTS = 8
+_yf_semaphore = threading.BoundedSemaphore(YF_MAX_CONCURRENT_REQUESTS)
+
+# 令牌桶限速：允许最多 YF_BURST_REQUESTS 个请求突发，之后按 YF_REQUESTS_PER_SECOND 的速率补充
+YF_BURST_REQUESTS = 10
+YF_REQUESTS_PER_SECOND = 2.0
+_yf_bucket_lock = threading.Lock()
+_yf_tokens = float(YF_BURST_REQUESTS)
+_yf_last_refill = time.monotonic()
+
+def _acquire_yf_token():
+    """从令牌桶取出一个请求令牌，桶空时等待到下一个令牌补充"""
+    global _yf_tokens, _yf_last_refill
+    while True:
+        with _yf_bucket_lock:
+            now = time.monotonic()
+            _yf_tokens = min(YF_BURST_REQUESTS, _yf_tokens + (now - _yf_last_refill) * YF_REQUESTS_PER_SECOND)
+            _yf_last_refill = now
+            if _yf_tokens >= 1.0:
+                _yf_tokens -= 1.0
+                return
+            wait = (1.0 - _yf_tokens) / YF_REQUESTS_PER_SECOND
+        time.sleep(wait)
+
+@contextlib.contextmanager
+def _yf_request():
+    """发起一次 Yahoo Finance 请求前调用：先按速率取令牌，再占用一个并发名额"""
+    _acquire_yf_token()
+    with _yf_semaphore:
+        yield
+
+# Yahoo Finance 行情图表接口：只返回少量 JSON，获取最新价格时比 Ticker.info 轻量得多
+YF_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+YF_CHART_TIMEOUT = 5
+# 复用 TLS 连接；Yahoo 会拒绝默认的 python-requests User-Agent
+_yf_session = requests.Session()
+_yf_session.headers["User-Agent"] = "Mozilla/5.0"
+
+# 多只股票并发分析时的线程数（I/O 密集，线程在网络读写时释放 GIL）
+ANALYSIS_MAX_WORKERS = 8
+
+# ==========================================
+# 行情数据缓存
+# ==========================================
+# 磁盘缓存目录（相对于运行目录），文件名包含日期，跨天自动失效
+CACHE_DIR = Path(".cache") / "yf"
+# 只有周线/月线写入磁盘缓存；日线等短周期数据用于获取最新价格，需要实时下载
+CACHEABLE_INTERVALS = ("1wk", "1mo")
+
+def _cache_path(normalized_symbol, period, interval, cache_date):
+    """磁盘缓存文件路径"""
+    return CACHE_DIR / f"{normalized_symbol}_{period}_{interval}_{cache_date}.parquet"
+
+@functools.lru_cache(maxsize=1)
+def _prune_stale_cache(cache_date):
+    """
+    删除非当天的缓存文件，避免缓存目录无限增长（每个日期只执行一次）
+    
+    Args:
+        cache_date: 当天的缓存日期键（YYYY-MM-DD）
+    """
+    if not CACHE_DIR.exists():
+        return
+    for path in CACHE_DIR.glob("*.parquet"):
+        if not path.stem.endswith(f"_{cache_date}"):
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"删除过期缓存 {path} 失败: {str(e)}")
+
+def _download_history(normalized_symbol, period, interval, cache_date):
+    """
+    从 yfinance 下载历史行情，周线/月线写入当天的 Parquet 缓存文件
+    
+    Args:
+        normalized_symbol: 标准化后的股票代码
+        period: 数据周期
+        interval: 数据间隔
+        cache_date: 缓存日期键（YYYY-MM-DD）
+    
+    Returns:
+        历史数据 DataFrame
+    """
+    with _yf_request():
+        df = yf.Ticker(normalized_symbol).history(period=period, interval=interval)
+    if interval in CACHEABLE_INTERVALS and len(df) > 0:
+        path = _cache_path(normalized_symbol, period, interval, cache_date)
+        try:
+            _prune_stale_cache(cache_date)
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(path)
+        except Exception as e:
+            print(f"写入缓存 {path} 失败: {str(e)}")
+    return df
+
+@functools.lru_cache(maxsize=128)
+def _fetch_history(normalized_symbol, period, interval, cache_date):
+    """
+    获取历史行情，进程内通过 lru_cache 复用，周线/月线优先读取当天的 Parquet 缓存文件
+    
+    Args:
+        normalized_symbol: 标准化后的股票代码
+        period: 数据周期
+        interval: 数据间隔
+        cache_date: 缓存日期键（YYYY-MM-DD）
+    
+    Returns:
+        历史数据 DataFrame（缓存中的共享对象，调用方修改前需要 copy）
+    """
+    path = _cache_path(normalized_symbol, period, interval, cache_date)
+    if interval in CACHEABLE_INTERVALS and path.exists():
+        try:
+            return pd.read_parquet(path)
+        except Exception as e:
+            print(f"读取缓存 {path} 失败，重新下载: {str(e)}")
+    return _download_history(normalized_symbol, period, interval, cache_date)
+
+def clear_stock_data_cache(include_disk=False):
+    """
+    清空行情数据缓存（测试或需要强制重新下载时使用）
+    
+    Args:
+        include_disk: 是否同时删除磁盘上的 Parquet 缓存文件，默认只清空进程内缓存
+    """
+    _fetch_history.cache_clear()
+    if include_disk and CACHE_DIR.exists():
+        for path in CACHE_DIR.glob("*.parquet"):
+            path.unlink(missing_ok=True)
+
 # ==========================================
 # 股票数据获取
 # ==========================================
-def get_stock_data(symbol, market=MARKET_US, period="2y", interval="1wk"):
+def get_stock_data(symbol, market=MARKET_US, period="2y", interval="1wk", force_refresh=False):
     """
     获取股票历史数据
     
@@ -150,20 +482,131 @@ def get_stock_data(symbol, market=MARKET_US, period="2y", interval="1wk"):
         market: 市场类型 (US/HK)
         period: 数据周期，默认2年
         interval: 数据间隔，默认周线
+        force_refresh: 是否跳过缓存重新下载（下载结果会覆盖当天的磁盘缓存）
     
     Returns:
         包含历史数据的 DataFrame，失败返回 None
     """
     try:
         normalized_symbol = normalize_symbol(symbol, market)
-        ticker = yf.Ticker(normalized_symbol)
-        df = ticker.history(period=period, interval=interval)
-        return df if len(df) > 0 else None
+        cache_date = date.today().isoformat()
+        if force_refresh:
+            # lru_cache 无法按键失效，清空进程内缓存，之后的普通调用从刚写入的磁盘缓存读取新数据
+            _fetch_history.cache_clear()
+            df = _download_history(normalized_symbol, period, interval, cache_date)
+        else:
+            df = _fetch_history(normalized_symbol, period, interval, cache_date)
+        return df.copy() if len(df) > 0 else None
     except Exception as e:
         market_name = get_market_name(market)
         print(f"获取{market_name} {symbol} 数据时出错: {str(e)}")
         return None
 
+def get_stock_data_batch(symbols, market=MARKET_US, period="2y", interval="1wk", force_refresh=False):
+    """
+    批量获取多只股票的历史数据，未命中缓存的股票合并为一次 yf.download 请求
+    
+    Args:
+        symbols: 股票代码列表
+        market: 市场类型 (US/HK)
+        period: 数据周期，默认2年
+        interval: 数据间隔，默认周线
+        force_refresh: 是否跳过磁盘缓存全部重新下载（下载结果会覆盖当天的磁盘缓存）
+    
+    Returns:
+        字典 {symbol: DataFrame}，获取失败或无数据的股票值为 None
+    """
+    cache_date = date.today().isoformat()
+    normalized = {symbol: normalize_symbol(symbol, market) for symbol in symbols}
+    use_disk = interval in CACHEABLE_INTERVALS
+    
+    # 已有磁盘缓存的股票直接读取，其余合并下载
+    frames = {}
+    missing = []
+    for symbol, normalized_symbol in normalized.items():
+        path = _cache_path(normalized_symbol, period, interval, cache_date)
+        if use_disk and not force_refresh and path.exists():
+            try:
+                frames[symbol] = pd.read_parquet(path)
+                continue
+            except Exception as e:
+                print(f"读取缓存 {path} 失败，重新下载: {str(e)}")
+        missing.append(symbol)
+    
+    if force_refresh:
+        # 与 get_stock_data 一致，避免之后的单只股票调用仍返回刷新前的进程内缓存
+        _fetch_history.cache_clear()
+    
+    if missing:
+        tickers = list(dict.fromkeys(normalized[symbol] for symbol in missing))
+        try:
+            with _yf_request():
+                bulk = yf.download(
+                    tickers=" ".join(tickers),
+                    period=period,
+                    interval=interval,
+                    group_by="ticker",
+                    auto_adjust=True,
+                    actions=True,
+                    threads=True,
+                    progress=False,
+                )
+        except Exception as e:
+            market_name = get_market_name(market)
+            print(f"批量获取{market_name}数据时出错: {str(e)}")
+            bulk = None
+        
+        for symbol in missing:
+            normalized_symbol = normalized[symbol]
+            if bulk is None or len(bulk) == 0:
+                continue
+            if isinstance(bulk.columns, pd.MultiIndex):
+                if normalized_symbol not in bulk.columns.get_level_values(0):
+                    continue
+                df = bulk[normalized_symbol]
+            else:
+                df = bulk
+            # 多只股票按日期对齐后，缺失交易日的行为全 NaN，需要逐只去掉
+            df = df.dropna(subset=["Open", "High", "Low", "Close"], how="all")
+            df.columns.name = None
+            if len(df) == 0:
+                continue
+            frames[symbol] = df
+            if use_disk:
+                path = _cache_path(normalized_symbol, period, interval, cache_date)
+                try:
+                    _prune_stale_cache(cache_date)
+                    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    df.to_parquet(path)
+                except Exception as e:
+                    print(f"写入缓存 {path} 失败: {str(e)}")
+    
+    return {symbol: (frames[symbol].copy() if symbol in frames and len(frames[symbol]) > 0 else None) for symbol in symbols}
+
+def _fetch_chart_price(normalized_symbol):
+    """
+    通过 Yahoo Finance 行情图表接口获取最新价格
+    
+    Args:
+        normalized_symbol: 标准化后的股票代码
+    
+    Returns:
+        最新市场价格（接口未提供时取最近一个非空收盘价），均无数据返回 None
+    """
+    with _yf_request():
+        response = _yf_session.get(
+            YF_CHART_URL.format(symbol=normalized_symbol),
+            params={"interval": "1d", "range": "5d"},
+            timeout=YF_CHART_TIMEOUT,
+        )
+    response.raise_for_status()
+    result = response.json()["chart"]["result"][0]
+    price = result["meta"].get("regularMarketPrice")
+    if price is not None:
+        return price
+    closes = result["indicators"]["quote"][0]["close"]
+    return next((close for close in reversed(closes) if close is not None), None)
+
 def get_current_stock_price(symbol, market):
     """
     获取股票当前价格
@@ -177,14 +620,18 @@ def get_current_stock_price(symbol, market):
     """
     try:
         normalized_symbol = normalize_symbol(symbol, market)
-        ticker = yf.Ticker(normalized_symbol)
-        info = ticker.info
-        current_price = info.get('regularMarketPrice') or info.get('currentPrice')
+        try:
+            current_price = _fetch_chart_price(normalized_symbol)
+        except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"行情图表接口获取 {normalized_symbol} 价格失败，改用 yfinance: {str(e)}")
+            with _yf_request():
+                info = yf.Ticker(normalized_symbol).info
+            current_price = info.get('regularMarketPrice') or info.get('currentPrice')
         if current_price is None:
             # 尝试从历史数据获取最新收盘价
             df = get_stock_data(symbol, market, period="5d", interval="1d")
             if df is not None and len(df) > 0:
-                current_price = df.iloc[-1]['Close']
+                current_price = df['Close'].iat[-1]
         return round(current_price, 2) if current_price is not None else None
     except Exception as e:
         market_name = get_market_name(market)
@@ -194,112 +641,157 @@ def get_current_stock_price(symbol, market):
 # ==========================================
 # 买入规则检验（10条规则）
 # ==========================================
-def check_buy_rules(df):
+# 规则检验结果在分析字典中的键名（rule_1 ~ rule_10）
+RULE_COLUMNS = [f"rule_{i}" for i in range(1, 11)]
+
+def _rules_unreachable(passed, remaining, min_rules_passed):
+    """
+    判断剩余规则全部达成时是否仍无法达到最少达成数量
+    
+    Args:
+        passed: 已达成的规则数量
+        remaining: 尚未检验的规则数量
+        min_rules_passed: 最少达成数量，None 表示不提前结束
+    
+    Returns:
+        无法达到时返回 True
+    """
+    return min_rules_passed is not None and passed + remaining < min_rules_passed
+
+# 规则检验中计算 MACD 只使用最近的 N 周：EMA 起点的影响按 (1 - alpha)^N 衰减，
+# 26 周慢线经过 300 周后约为 (25/27)^300 ≈ 1e-10，即使价格在千元量级，截断误差也远小于展示精度（4 位小数）
+MACD_WARMUP_BARS = 300
+
+def _pack_rules_mask(rules):
+    """
+    将按顺序排列的规则检验结果打包为位掩码（第 i 条规则对应第 i-1 位）
+    
+    Args:
+        rules: 规则1到规则10的检验结果序列
+    
+    Returns:
+        int 位掩码
+    """
+    rules_mask = 0
+    for bit, rule_passed in enumerate(rules):
+        if rule_passed:
+            rules_mask |= 1 << bit
+    return rules_mask
+
+def check_buy_rules(close, open_, volume, min_rules_passed=None):
     """
     检验买入规则（10条规则）
     
+    规则按计算成本从低到高分阶段检验（1-4、7、8 → 10、5 → 6 → MACD 与 9）。
+    指定 min_rules_passed 时，一旦剩余规则全部达成也无法达到该数量，
+    就不再检验后续规则，未检验的规则记为未达成。
+    
     Args:
-        df: 包含股票历史数据的 DataFrame（需要至少30周数据）
+        close: 周收盘价 float64 数组（需要至少30周数据）
+        open_: 周开盘价 float64 数组，与 close 等长
+        volume: 周成交量 float64 数组，与 close 等长
+        min_rules_passed: 最少达成规则数量（可选，默认检验全部规则）
     
     Returns:
-        包含所有规则检验结果和相关数据的字典，失败返回 None
+        包含所有规则检验结果和相关数据的字典（提前结束时 short_circuited 为 True），失败返回 None
     """
-    if len(df) < 30:
+    if close.shape[0] < 30:
         return None
     
-    # 计算周线均线
-    df['10MA'] = df['Close'].rolling(window=10).mean()
-    df['20MA'] = df['Close'].rolling(window=20).mean()
-    df['30MA'] = df['Close'].rolling(window=30).mean()
-    
-    # 计算MACD
-    df = calculate_macd(df)
+    # 计算周线均线：一次前缀和，各周期只取最新一期（30周线另取上一期）
+    prefix = _prefix_sum(close)
+    ma10 = _window_mean(prefix, 10)
+    ma20 = _window_mean(prefix, 20)
+    ma30 = _window_mean(prefix, 30)
+    prev_ma30 = _window_mean(prefix, 30, lag=1)
     
-    # 获取最新数据
-    latest = df.iloc[-1]
-    prev_week = df.iloc[-2] if len(df) >= 2 else None
+    # 获取最新数据（至少30周数据，上一周一定存在）
+    curr_price, prev_close = close[-1], close[-2]
+    curr_volume, prev_volume = volume[-1], volume[-2]
     
-    curr_price = latest['Close']
-    ma10, ma20, ma30 = latest['10MA'], latest['20MA'], latest['30MA']
-    prev_ma30 = df.iloc[-2]['30MA'] if len(df) >= 2 and not pd.isna(df.iloc[-2]['30MA']) else None
+    # 规则中的比较只要有一侧为 NaN 结果就是 False，缺失数据的规则自然记为未达成，
+    # 因此规则检验不再逐个判断缺失值，只在输出结果时统一处理
     
     # 检验项1: 10周线是否位于20周线之上
-    rule_1 = ma10 > ma20 if not pd.isna(ma10) and not pd.isna(ma20) else False
+    rule_1 = ma10 > ma20
     
     # 检验项2: 当前股价是否处于20周线之上
-    rule_2 = curr_price > ma20 if not pd.isna(ma20) else False
+    rule_2 = curr_price > ma20
     
     # 检验项3: 当前股价是否处于30周线之上
-    rule_3 = curr_price > ma30 if not pd.isna(ma30) else False
+    rule_3 = curr_price > ma30
     
     # 检验项4: 30周线目前的趋势是向上吗（比较当前和前一周的30MA）
-    rule_4 = False
-    if prev_ma30 is not None and not pd.isna(ma30) and not pd.isna(prev_ma30):
-        rule_4 = ma30 > prev_ma30
-    
-    # 检验项5: 个股横盘是否超过6周（纵向波动小于20个点）
-    rule_5 = False
-    if len(df) >= 6:
-        recent_6_weeks = df.iloc[-6:]['Close']
-        max_price = recent_6_weeks.max()
-        min_price = recent_6_weeks.min()
+    rule_4 = ma30 > prev_ma30
+    
+    # 检验项7: 当前这一周的收盘价是否比上一周的收盘价高出5%个点
+    rule_7 = False
+    if prev_close > 0:
+        price_change_pct = ((curr_price - prev_close) / prev_close) * 100
+        rule_7 = price_change_pct >= 5
+    
+    # 检验项8: 当前这一周的成交量是否比上一周高
+    rule_8 = curr_volume > prev_volume
+    
+    rule_5 = rule_6 = rule_9 = rule_10 = False
+    macd_dif = macd_dea = np.nan
+    passed = sum((rule_1, rule_2, rule_3, rule_4, rule_7, rule_8))
+    short_circuited = _rules_unreachable(passed, 4, min_rules_passed)
+    
+    if not short_circuited:
+        # 检验项10: 最近一周的收盘价是否是至少10周的最高价
+        # （与 pandas 的 max/min 一致，忽略窗口中的 NaN）
+        rule_10 = curr_price >= np.nanmax(close[-10:])
+        
+        # 检验项5: 个股横盘是否超过6周（纵向波动小于20个点）
+        recent_6_weeks = close[-6:]
+        max_price = np.nanmax(recent_6_weeks)
+        min_price = np.nanmin(recent_6_weeks)
         if max_price > 0:
             volatility_pct = ((max_price - min_price) / min_price) * 100
             rule_5 = volatility_pct < 20
+        
+        passed += int(rule_10) + int(rule_5)
+        short_circuited = _rules_unreachable(passed, 2, min_rules_passed)
     
-    # 检验项6: 横盘期间的下跌成交量是否有缩量的趋势
-    rule_6 = False
-    if len(df) >= 6 and rule_5:
-        recent_6_weeks = df.iloc[-6:].copy()
-        recent_6_weeks['IsDown'] = recent_6_weeks['Close'] < recent_6_weeks['Open']
-        down_weeks = recent_6_weeks[recent_6_weeks['IsDown']]
-        if len(down_weeks) >= 2:
-            volumes = down_weeks['Volume'].values
-            if len(volumes) >= 2:
-                mid = len(volumes) // 2
-                early_avg = np.mean(volumes[:mid])
-                late_avg = np.mean(volumes[mid:])
+    if not short_circuited:
+        # 检验项6: 横盘期间的下跌成交量是否有缩量的趋势
+        if rule_5:
+            is_down = close[-6:] < open_[-6:]
+            down_volumes = volume[-6:][is_down]
+            if down_volumes.size >= 2:
+                mid = down_volumes.size // 2
+                early_avg = down_volumes[:mid].mean()
+                late_avg = down_volumes[mid:].mean()
                 if early_avg > 0:
                     rule_6 = late_avg < early_avg
+        
+        passed += int(rule_6)
+        short_circuited = _rules_unreachable(passed, 1, min_rules_passed)
     
-    # 检验项7: 当前这一周的收盘价是否比上一周的收盘价高出5%个点
-    rule_7 = False
-    if prev_week is not None:
-        prev_close = prev_week['Close']
-        if prev_close > 0:
-            price_change_pct = ((curr_price - prev_close) / prev_close) * 100
-            rule_7 = price_change_pct >= 5
+    if not short_circuited:
+        # 计算MACD（只用最近 MACD_WARMUP_BARS 周，只取最新一期的值）
+        dif, dea = _macd_arrays(close[-MACD_WARMUP_BARS:])
+        macd_dif, macd_dea = dif[-1], dea[-1]
+        
+        # 检验项9: MACD线是否DIF线在DEA线之上
+        rule_9 = macd_dif > macd_dea
     
-    # 检验项8: 当前这一周的成交量是否比上一周高
-    rule_8 = False
-    if prev_week is not None:
-        curr_volume = latest['Volume']
-        prev_volume = prev_week['Volume']
-        if not pd.isna(curr_volume) and not pd.isna(prev_volume):
-            rule_8 = curr_volume > prev_volume
-    
-    # 检验项9: MACD线是否DIF线在DEA线之上
-    rule_9 = False
-    if not pd.isna(latest['MACD_DIF']) and not pd.isna(latest['MACD_DEA']):
-        rule_9 = latest['MACD_DIF'] > latest['MACD_DEA']
-    
-    # 检验项10: 最近一周的收盘价是否是至少10周的最高价
-    rule_10 = False
-    if len(df) >= 10:
-        recent_10_weeks = df.iloc[-10:]['Close']
-        max_price_10_weeks = recent_10_weeks.max()
-        rule_10 = curr_price >= max_price_10_weeks
+    # 将10条规则打包为位掩码，达成数量即置位数
+    rules_mask = _pack_rules_mask((rule_1, rule_2, rule_3, rule_4, rule_5,
+                                   rule_6, rule_7, rule_8, rule_9, rule_10))
     
+    # 数值保持原始精度，四舍五入在格式化输出时通过 _round_for_display 完成
     return {
-        "price": round(curr_price, 2),
-        "ma10": round(ma10, 2) if not pd.isna(ma10) else None,
-        "ma20": round(ma20, 2) if not pd.isna(ma20) else None,
-        "ma30": round(ma30, 2) if not pd.isna(ma30) else None,
-        "macd_dif": round(latest['MACD_DIF'], 4) if not pd.isna(latest['MACD_DIF']) else None,
-        "macd_dea": round(latest['MACD_DEA'], 4) if not pd.isna(latest['MACD_DEA']) else None,
-        "prev_close": round(prev_week['Close'], 2) if prev_week is not None else None,
-        "curr_volume": round(latest['Volume'], 0) if not pd.isna(latest['Volume']) else None,
-        "prev_volume": round(prev_week['Volume'], 0) if prev_week is not None and not pd.isna(prev_week['Volume']) else None,
+        "price": curr_price,
+        "ma10": ma10,
+        "ma20": ma20,
+        "ma30": ma30,
+        "macd_dif": macd_dif,
+        "macd_dea": macd_dea,
+        "prev_close": prev_close,
+        "curr_volume": curr_volume,
+        "prev_volume": prev_volume,
         "rule_1": rule_1,  # 10周线是否位于20周线之上
         "rule_2": rule_2,  # 当前股价是否处于20周线之上
         "rule_3": rule_3,  # 当前股价是否处于30周线之上
@@ -310,25 +802,35 @@ def check_buy_rules(df):
         "rule_8": rule_8,  # 当前这一周的成交量是否比上一周高
         "rule_9": rule_9,  # MACD线是否DIF线在DEA线之上
         "rule_10": rule_10,  # 最近一周的收盘价是否是至少10周的最高价
+        "rules_mask": rules_mask,  # 规则达成位掩码
+        "short_circuited": short_circuited,  # 是否因无法达到最少达成数量而提前结束检验
     }
 
-def get_stock_analysis(symbol, market=MARKET_US):
+def get_stock_analysis(symbol, market=MARKET_US, min_rules_passed=None, df=None):
     """
     获取股票分析数据（包含买入规则检验）
     
     Args:
         symbol: 股票代码
         market: 市场类型 (US/HK)
+        min_rules_passed: 最少达成规则数量，传入后无法达到时提前结束规则检验（可选）
+        df: 预先批量获取的历史数据，为 None 时单独下载（可选）
     
     Returns:
         包含分析结果的字典，失败返回 None
     """
     try:
-        df = get_stock_data(symbol, market)
+        if df is None:
+            df = get_stock_data(symbol, market)
         if df is None or len(df) < 30:
             return None
         
-        result = check_buy_rules(df)
+        result = check_buy_rules(
+            _column_array(df, 'Close'),
+            _column_array(df, 'Open'),
+            _column_array(df, 'Volume'),
+            min_rules_passed,
+        )
         if result:
             # 保存显示用的代码
             result["symbol"] = get_display_symbol(symbol, market)
@@ -339,26 +841,119 @@ def get_stock_analysis(symbol, market=MARKET_US):
         print(f"分析{market_name} {symbol} 时出错: {str(e)}")
         return None
 
+def analyze_symbols(symbols, market=MARKET_US, min_rules_passed=None, max_workers=ANALYSIS_MAX_WORKERS,
+                    force_refresh=False):
+    """
+    批量分析多只股票：先一次性批量下载历史数据，再用线程池并发执行买入规则检验
+    
+    Args:
+        symbols: 股票代码列表
+        market: 市场类型 (US/HK)
+        min_rules_passed: 最少达成规则数量，传入后无法达到时提前结束规则检验（可选）
+        max_workers: 线程数，默认 ANALYSIS_MAX_WORKERS
+        force_refresh: 是否跳过行情缓存重新下载
+    
+    Returns:
+        与 symbols 顺序一致的分析结果列表，数据不足或分析失败的股票为 None
+    """
+    frames = get_stock_data_batch(symbols, market, force_refresh=force_refresh)
+    _warmup_macd_kernels()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda symbol: get_stock_analysis(symbol, market, min_rules_passed, frames[symbol]),
+            symbols,
+        ))
+
 def count_rules_passed(data):
     """
     计算达成规则的数量
     
     Args:
-        data: 包含 rule_1 到 rule_10 的字典
+        data: 分析结果字典（优先使用 rules_mask，没有时根据 rule_1 到 rule_10 打包）
     
     Returns:
         达成规则的数量
     """
-    return sum([
-        data['rule_1'], data['rule_2'], data['rule_3'], data['rule_4'],
-        data['rule_5'], data['rule_6'], data['rule_7'], data['rule_8'], 
-        data['rule_9'], data['rule_10']
-    ])
+    rules_mask = data.get('rules_mask')
+    if rules_mask is None:
+        rules_mask = _pack_rules_mask(data[column] for column in RULE_COLUMNS)
+    return rules_mask.bit_count()
 
 # ==========================================
 # 报告生成辅助函数
 # ==========================================
-def format_stock_analysis_text(data, symbol=None, market=None):
+# 规则判定结果的显示文本
+RULE_STATUS_TEXT = {True: "✅ 达成", False: "❌ 未达成"}
+
+# 10条买入规则的描述，顺序与 rule_1 到 rule_10 对应
+_RULE_LABELS = (
+    "10周线是否位于20周线之上",
+    "当前股价是否处于20周线之上",
+    "当前股价是否处于30周线之上",
+    "30周线目前的趋势是向上吗",
+    "个股横盘是否超过6周（纵向波动小于20个点）",
+    "横盘期间的下跌成交量是否有缩量的趋势",
+    "当前这一周的收盘价是否比上一周的收盘价高出5%个点",
+    "当前这一周的成交量是否比上一周高",
+    "MACD线是否DIF线在DEA线之上",
+    "最近一周的收盘价是否是至少10周的最高价",
+)
+
+# 单只股票分析文本的固定部分（模块加载时构建一次），规则判定行按 _RULE_LABELS 拼接
+_STOCK_ANALYSIS_HEADER = """
+==========================================
+标的: {symbol} ({market_name})
+当前价格: {currency}{price}
+
+技术指标状况:
+- 周线 10MA: {currency}{ma10}
+- 周线 20MA: {currency}{ma20}
+- 周线 30MA: {currency}{ma30}
+- MACD DIF: {macd_dif}
+- MACD DEA: {macd_dea}
+- 上一周收盘价: {currency}{prev_close}
+- 当前周成交量: {curr_volume}
+- 上一周成交量: {prev_volume}
+
+检验项判定结果:
+"""
+_RULE_LINE_PREFIXES = tuple(f"{i}. {label}: " for i, label in enumerate(_RULE_LABELS, 1))
+_STOCK_ANALYSIS_FOOTER = """
+达成情况: {rules_passed}/{total_rules} 项检验通过
+==========================================
+"""
+
+# 分析结果中用于展示的数值字段及保留的小数位数
+_DISPLAY_DECIMALS = {
+    "price": 2,
+    "ma10": 2,
+    "ma20": 2,
+    "ma30": 2,
+    "macd_dif": 4,
+    "macd_dea": 4,
+    "prev_close": 2,
+    "curr_volume": 0,
+    "prev_volume": 0,
+}
+
+def _round_for_display(data):
+    """
+    按展示精度四舍五入分析结果中的数值字段，缺失值（NaN）转为 None
+    
+    Args:
+        data: check_buy_rules 返回的分析数据字典
+    
+    Returns:
+        数值字段已四舍五入的新字典，其余字段保持不变
+    """
+    rounded = dict(data)
+    isnan = math.isnan
+    for key, digits in _DISPLAY_DECIMALS.items():
+        value = data[key]
+        rounded[key] = None if value is None or isnan(value) else round(value, digits)
+    return rounded
+
+def format_stock_analysis_text(data, symbol=None, market=None, rules_passed=None):
     """
     格式化单只股票的分析文本
     
@@ -366,51 +961,57 @@ def format_stock_analysis_text(data, symbol=None, market=None):
         data: 股票分析数据字典
         symbol: 股票代码（如果 data 中没有）
         market: 市场类型（如果 data 中没有）
+        rules_passed: 已统计好的达成规则数量（可选，未传入时根据 data 统计）
     
     Returns:
         格式化的分析文本
     """
-    stock_symbol = data.get('symbol', symbol)
     stock_market = data.get('market', market) or MARKET_US
     currency = get_currency_symbol(stock_market)
-    market_name = get_market_name(stock_market)
-    rules_passed = count_rules_passed(data)
-    total_rules = 10
-    
-    return f"""
-==========================================
-标的: {stock_symbol} ({market_name})
-当前价格: {currency}{data['price']}
-
-技术指标状况:
-- 周线 10MA: {currency}{data['ma10']}
-- 周线 20MA: {currency}{data['ma20']}
-- 周线 30MA: {currency}{data['ma30']}
-- MACD DIF: {data['macd_dif']}
-- MACD DEA: {data['macd_dea']}
-- 上一周收盘价: {currency}{data['prev_close']}
-- 当前周成交量: {data['curr_volume']}
-- 上一周成交量: {data['prev_volume']}
-
-检验项判定结果:
-1. 10周线是否位于20周线之上: {"✅ 达成" if data['rule_1'] else "❌ 未达成"}
-2. 当前股价是否处于20周线之上: {"✅ 达成" if data['rule_2'] else "❌ 未达成"}
-3. 当前股价是否处于30周线之上: {"✅ 达成" if data['rule_3'] else "❌ 未达成"}
-4. 30周线目前的趋势是向上吗: {"✅ 达成" if data['rule_4'] else "❌ 未达成"}
-5. 个股横盘是否超过6周（纵向波动小于20个点）: {"✅ 达成" if data['rule_5'] else "❌ 未达成"}
-6. 横盘期间的下跌成交量是否有缩量的趋势: {"✅ 达成" if data['rule_6'] else "❌ 未达成"}
-7. 当前这一周的收盘价是否比上一周的收盘价高出5%个点: {"✅ 达成" if data['rule_7'] else "❌ 未达成"}
-8. 当前这一周的成交量是否比上一周高: {"✅ 达成" if data['rule_8'] else "❌ 未达成"}
-9. MACD线是否DIF线在DEA线之上: {"✅ 达成" if data['rule_9'] else "❌ 未达成"}
-10. 最近一周的收盘价是否是至少10周的最高价: {"✅ 达成" if data['rule_10'] else "❌ 未达成"}
-
-达成情况: {rules_passed}/{total_rules} 项检验通过
-==========================================
-"""
+    values = _round_for_display(data)
+    parts = [_STOCK_ANALYSIS_HEADER.format(
+        symbol=data.get('symbol', symbol),
+        market_name=get_market_name(stock_market),
+        currency=currency,
+        price=values['price'],
+        ma10=values['ma10'],
+        ma20=values['ma20'],
+        ma30=values['ma30'],
+        macd_dif=values['macd_dif'],
+        macd_dea=values['macd_dea'],
+        prev_close=values['prev_close'],
+        curr_volume=values['curr_volume'],
+        prev_volume=values['prev_volume'],
+    )]
+    for prefix, column in zip(_RULE_LINE_PREFIXES, RULE_COLUMNS):
+        parts.append(prefix)
+        parts.append(RULE_STATUS_TEXT[data[column]])
+        parts.append("\n")
+    parts.append(_STOCK_ANALYSIS_FOOTER.format(
+        rules_passed=count_rules_passed(data) if rules_passed is None else rules_passed,
+        total_rules=len(RULE_COLUMNS),
+    ))
+    return "".join(parts)
 
 # ==========================================
 # AI 报告生成
 # ==========================================
+@functools.lru_cache(maxsize=None)
+def _get_deepseek_client(api_key):
+    """
+    获取 DeepSeek 客户端（同一个 API 密钥在进程内复用一个实例，沿用其连接池，避免每次调用重新建立 TLS 连接）
+    
+    Args:
+        api_key: API密钥
+    
+    Returns:
+        OpenAI 客户端实例
+    """
+    return OpenAI(
+        api_key=api_key,
+        base_url="https://api.deepseek.com"
+    )
+
 def call_deepseek_api(prompt, api_key=None):
     """
     调用 DeepSeek API 生成报告
@@ -425,10 +1026,7 @@ def call_deepseek_api(prompt, api_key=None):
     if api_key is None:
         api_key = get_config()["DEEPSEEK_API_KEY"]
     
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://api.deepseek.com"
-    )
+    client = _get_deepseek_client(api_key)
     
     response = client.chat.completions.create(
         model="deepseek-reasoner",
@@ -442,7 +1040,28 @@ def call_deepseek_api(prompt, api_key=None):
 # ==========================================
 # 邮件发送
 # ==========================================
-def send_email(subject, body, config=None):
+SMTP_HOST = 'smtp.qq.com'
+SMTP_PORT = 465
+
+@contextlib.contextmanager
+def smtp_connection(config=None):
+    """
+    打开一个已登录的 SMTP 连接（QQ邮箱），需要连续发送多封邮件时传给 send_email 复用，只进行一次 TLS 握手和登录
+    
+    Args:
+        config: 配置字典（可选，默认从环境变量获取）
+    
+    Yields:
+        已登录的 smtplib.SMTP_SSL 实例，退出时自动关闭连接
+    """
+    if config is None:
+        config = get_config()
+    
+    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as smtp:
+        smtp.login(config["SENDER_EMAIL"], config["SENDER_PASSWORD"])
+        yield smtp
+
+def send_email(subject, body, config=None, smtp=None):
     """
     通过 SMTP 发送邮件（QQ邮箱）
     
@@ -450,6 +1069,7 @@ def send_email(subject, body, config=None):
         subject: 邮件主题
         body: 邮件正文
         config: 配置字典（可选，默认从环境变量获取）
+        smtp: smtp_connection() 打开的连接（可选，未传入时为本封邮件单独建立连接）
     """
     if config is None:
         config = get_config()
@@ -468,8 +1088,10 @@ def send_email(subject, body, config=None):
     msg['To'] = receiver_email
 
     try:
-        with smtplib.SMTP_SSL('smtp.qq.com', 465) as smtp:
-            smtp.login(sender_email, sender_password)
+        if smtp is None:
+            with smtp_connection(config) as smtp:
+                smtp.send_message(msg)
+        else:
             smtp.send_message(msg)
     except smtplib.SMTPAuthenticationError as e:
         error_msg = str(e)